@@ -1,491 +1,1089 @@
-import json, hashlib, datetime, qrcode, base64, sys, time, re, os
-from github import Github, InputFileContent
-from pyzbar.pyzbar import decode
-from PIL import Image
-
-# Optional: Install pyqrcode for ASCII support if not already installed
-try:
-    import pyqrcode
-    HAS_ASCII = True
-except ImportError:
-    HAS_ASCII = False
-
-# Configuration
-from dotenv import load_dotenv
-load_dotenv()
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Set base directory to script location
-GITHUB_TOKEN = os.getenv("GITHUB_TOKEN", "")
-GIST_FILENAME = os.getenv("GIST_FILENAME", "vote_chain.json")
-GIST_DESCRIPTION = os.getenv("GIST_DESCRIPTION", "QR Vote Street Talk Blockchain")
-
-# Election end time will be set dynamically for genesis vote
-ELECTION_END_TIME = None
-
-# Try to import stegano for steganography, fall back if unavailable
-try:
-    from stegano import lsb
-    HAS_STEGANOGRAPHY = True
-except ImportError:
-    HAS_STEGANOGRAPHY = False
-
-def parse_election_end_time(elec_input):
-    """Parse election end time from --elec flag input."""
-    global ELECTION_END_TIME
-    now = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc)
-    
-    # Check for relative time (e.g., "240min", "4h", "2d")
-    match = re.match(r'^(\d+)(min|h|d)$', elec_input.strip().lower())
-    if match:
-        value, unit = int(match.group(1)), match.group(2)
-        if unit == 'min':
-            delta = datetime.timedelta(minutes=value)
-        elif unit == 'h':
-            delta = datetime.timedelta(hours=value)
-        elif unit == 'd':
-            delta = datetime.timedelta(days=value)
-        ELECTION_END_TIME = now + delta
-        return True
-    
-    # Check for absolute time (e.g., "2025-06-15 18:00:00+00:00")
-    try:
-        ELECTION_END_TIME = datetime.datetime.fromisoformat(elec_input.replace(' ', 'T')).replace(tzinfo=datetime.timezone.utc)
-        if ELECTION_END_TIME <= now:
-            print("Error: Election end time must be in the future.")
-            return False
-        return True
-    except ValueError:
-        print("Error: Invalid time format. Use '240min', '4h', '2d', or 'YYYY-MM-DD HH:MM:SS+00:00'.")
-        return False
-
-def log_verbose(msg, verbose=False):
-    """Log message with timestamp only in verbose mode."""
-    if verbose:
-        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
-    else:
-        print(msg)
-
-def show_loading(duration=2, message="Processing..."):
-    """Display a simple loading animation in the terminal."""
-    animation = ["|", "/", "-", "\\"]
-    start_time = time.time()
-    while time.time() - start_time < duration:
-        for frame in animation:
-            sys.stdout.write(f"\r{message} {frame}")
-            sys.stdout.flush()
-            time.sleep(0.2)
-    sys.stdout.write("\r" + " " * 50 + "\r")  # Clear the line
-    sys.stdout.flush()
-
-def hash_block(block):
-    """Calculate SHA-256 hash of a block"""
-    block_string = json.dumps(block, sort_keys=True).encode()
-    return hashlib.sha256(block_string).hexdigest()
-
-def load_chain(g, verbose=False):
-    """Load the vote chain from Gist or local file and set ELECTION_END_TIME if present"""
-    global ELECTION_END_TIME
-    try:
-        if g:
-            user = g.get_user()
-            for gist in user.get_gists():
-                if GIST_FILENAME in gist.files:
-                    content = gist.files[GIST_FILENAME].content
-                    chain = json.loads(content) if content else []
-                    if chain and "election_end_time" in chain[0]:
-                        ELECTION_END_TIME = datetime.datetime.fromisoformat(chain[0]["election_end_time"]).replace(tzinfo=datetime.timezone.utc)
-                    return gist, chain
-        local_path = os.path.join(BASE_DIR, "vote_chain.json")
-        if os.path.exists(local_path):
-            with open(local_path, "r") as f:
-                content = f.read().strip()
-                chain = json.loads(content) if content else []
-                if chain and "election_end_time" in chain[0]:
-                    ELECTION_END_TIME = datetime.datetime.fromisoformat(chain[0]["election_end_time"]).replace(tzinfo=datetime.timezone.utc)
-                return None, chain
-        return None, []
-    except Exception as e:
-        log_verbose(f"Error loading chain: {e}", verbose)
-        return None, []
-
-def sync_local_chain(g, gist, local_chain, verbose=False):
-    """Sync local vote_chain.json with the latest Gist data, merging with local changes"""
-    if g and gist:
-        try:
-            show_loading(message="Syncing with Gist...")
-            content = gist.files[GIST_FILENAME].content
-            gist_chain = json.loads(content) if content else []
-            merged_chain = merge_chains(local_chain, gist_chain)
-            local_path = os.path.join(BASE_DIR, "vote_chain.json")
-            with open(local_path, "w") as f:
-                json.dump(merged_chain, f, indent=2)
-            log_verbose(f"Local chain synced with Gist. Blocks: {len(merged_chain)}, First hash: {merged_chain[1]['hash'] if len(merged_chain) > 1 else 'N/A'}", verbose)
-            return merged_chain
-        except Exception as e:
-            log_verbose(f"Error syncing local chain: {e}", verbose)
-            return local_chain
-    return local_chain
-
-def add_vote(candidate, prev_hash):
-    """Create a new vote block"""
-    block = {
-        "vote": candidate,
-        "timestamp": datetime.datetime.utcnow().isoformat(),
-        "prev_hash": prev_hash
-    }
-    block["hash"] = hash_block(block)
-    return block
-
-def create_qr_code(candidate, steganography_message=None, verbose=False):
-    try:
-        show_loading(message="Generating QR code...")
-        qr_data = f"genesis:{candidate}"
-        qr = qrcode.QRCode(
-            version=2,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=4
-        )
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        qr_filename = f"qr_code_genesis_{candidate.replace(' ', '_')}_000001.png"
-        qr_path = os.path.join(BASE_DIR, "qrcodes", qr_filename)
-        qr_dir = os.path.join(BASE_DIR, "qrcodes")
-        os.makedirs(qr_dir, exist_ok=True)
-        
-        qr_image = qr.make_image(fill_color="black", back_color="white")
-        qr_image.save(qr_path)
-        log_verbose(f"QR code generated at: {qr_path}", verbose)
-
-        if HAS_STEGANOGRAPHY and steganography_message:
-            qr_image_rgb = qr_image.convert("RGB")
-            qr_image_rgb.save(qr_path)
-            MIN_LENGTH = 1
-            MAX_LENGTH = 100
-            if not (MIN_LENGTH <= len(steganography_message) <= MAX_LENGTH):
-                return qr_path
-            show_loading(message="Embedding steganography...")
-            # Create stego file discreetly without announcing
-            stego_path = os.path.join(qr_dir, f"stego_{qr_filename}")
-            secret_image = lsb.hide(qr_path, steganography_message)
-            secret_image.save(stego_path)
-            # Return original QR path to avoid mentioning stego
-            return qr_path
-        return qr_path
-    except Exception as e:
-        log_verbose(f"Error generating QR code or steganography: {e}", verbose)
-        return None
-
-def create_ascii_qr_code(candidate, verbose=False):
-    if not HAS_ASCII:
-        log_verbose("ASCII QR code generation requires 'pyqrcode' library. Please install it with 'pip install pyqrcode'", verbose)
-        return None
-    try:
-        show_loading(message="Generating ASCII QR code...")
-        qr_data = f"genesis:{candidate}"
-        qr = pyqrcode.create(qr_data, error='H', version=2)
-        ascii_art = qr.terminal(module_color=0, background=7, quiet_zone=1)
-        ascii_filename = f"qr_code_genesis_{candidate.replace(' ', '_')}_000001.txt"
-        ascii_path = os.path.join(BASE_DIR, "qrcodes", ascii_filename)
-        qr_dir = os.path.join(BASE_DIR, "qrcodes")
-        os.makedirs(qr_dir, exist_ok=True)
-        with open(ascii_path, "w") as f:
-            f.write(ascii_art)
-        log_verbose(f"ASCII QR code saved at: {ascii_path}", verbose)
-        return ascii_path
-    except Exception as e:
-        log_verbose(f"Error generating ASCII QR code: {e}", verbose)
-        return None
-
-def scan_and_vote(qr_filename, verbose=False):
-    """Scan a QR code and handle vote"""
-    try:
-        image = Image.open(qr_filename)
-        decoded_objects = decode(image)
-        if not decoded_objects:
-            return None
-        qr_data = decoded_objects[0].data.decode()
-        if qr_data.startswith("genesis:"):
-            candidate = qr_data[len("genesis:"):]
-            current_time = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc)
-            if ELECTION_END_TIME and current_time > ELECTION_END_TIME:
-                print(f"Election ended at {ELECTION_END_TIME}. No further votes accepted.")
-                return None
-            return candidate
-        return None
-    except Exception as e:
-        log_verbose(f"Error scanning QR code: {e}", verbose)
-        return None
-
-def validate_chain(chain, verbose=False):
-    """Validate the vote chain with optional verbose output, skipping non-vote blocks"""
-    try:
-        if not chain or all("vote" not in block for block in chain):  # No votes to validate
-            return True, "Chain is valid (no vote blocks)"
-        vote_blocks = [block for block in chain if "vote" in block]
-        if not vote_blocks:
-            return True, "Chain is valid (no vote blocks)"
-        for i, block in enumerate(vote_blocks[1:], 1):  # Validate from second vote block
-            prev_block = vote_blocks[i-1]
-            if block["prev_hash"] != prev_block["hash"]:
-                if verbose:
-                    log_verbose(f"Validation failed at block {chain.index(block)+1}: prev_hash {block['prev_hash']} != {prev_block['hash']}", verbose)
-                return False, f"Invalid prev_hash at block {chain.index(block)+1}"
-            block_copy = block.copy()
-            current_hash = block_copy.pop("hash")
-            calculated_hash = hash_block(block_copy)
-            if current_hash != calculated_hash:
-                if verbose:
-                    log_verbose(f"Validation failed at block {chain.index(block)+1}: stored hash {current_hash} != calculated {calculated_hash}", verbose)
-                return False, f"Invalid hash at block {chain.index(block)+1}"
-        if vote_blocks[0]["prev_hash"] != "genesis_hash":
-            if verbose:
-                log_verbose(f"Validation failed at block {chain.index(vote_blocks[0])+1}: prev_hash {vote_blocks[0]['prev_hash']} != genesis_hash", verbose)
-            return False, f"Invalid genesis hash at block {chain.index(vote_blocks[0])+1}"
-        return True, "Chain is valid"
-    except Exception as e:
-        if verbose:
-            log_verbose(f"Validation error: {e}", verbose)
-        return False, f"Validation error: {str(e)}"
-
-def save_chain(g, gist, chain, verbose=False):
-    """Save the vote chain to Gist or local file"""
-    try:
-        content = json.dumps(chain, indent=2)
-        local_path = os.path.join(BASE_DIR, "vote_chain.json")
-        with open(local_path, "w") as f:
-            json.dump(chain, f, indent=2)
-        if g and gist:
-            show_loading(message="Updating Gist...")
-            log_verbose(f"Attempting to update Gist with content: {content[:50]}...", verbose)
-            gist.edit(files={GIST_FILENAME: InputFileContent(content)})
-            log_verbose(f"Gist updated successfully at: {gist.html_url}", verbose)
-            return gist.html_url
-        log_verbose(f"Chain saved locally at: {local_path}", verbose)
-        return local_path
-    except Exception as e:
-        log_verbose(f"Error saving chain to Gist or local file: {e}", verbose)
-        return None
-
-def merge_chains(local_chain, gist_chain):
-    """Merge local and Gist chains, preserving existing hashes and metadata block"""
-    if not gist_chain and not local_chain:
-        return []
-    base_chain = gist_chain if gist_chain else local_chain
-    if not base_chain:
-        return []
-    
-    # Preserve metadata block if present
-    metadata = None
-    if base_chain and "election_end_time" in base_chain[0]:
-        metadata = base_chain[0]
-        base_chain = base_chain[1:]
-    
-    if local_chain and gist_chain and local_chain != gist_chain:
-        combined_chain = gist_chain[1:] + [b for b in local_chain[1:] if b not in gist_chain[1:]]
-    else:
-        combined_chain = base_chain
-    
-    if not combined_chain:
-        return [metadata] if metadata else []
-    
-    seen = set()
-    unique_chain = []
-    for block in combined_chain:
-        if "vote" in block:  # Only consider blocks with vote data
-            key = (block["vote"], block["timestamp"])
-            if key not in seen:
-                unique_chain.append(block)
-                seen.add(key)
-    
-    unique_chain = sorted(unique_chain, key=lambda x: x["timestamp"])
-    for i in range(1, len(unique_chain)):
-        if "prev_hash" not in unique_chain[i] or unique_chain[i]["prev_hash"] != unique_chain[i-1]["hash"]:
-            unique_chain[i]["prev_hash"] = unique_chain[i-1]["hash"]
-    if unique_chain and unique_chain[0]["prev_hash"] != "genesis_hash":
-        unique_chain[0]["prev_hash"] = "genesis_hash"
-    
-    return [metadata] + unique_chain if metadata else unique_chain
-
-def prune_chain(chain, vote_to_remove):
-    """Remove a specific vote and rebuild the chain"""
-    if not chain or len(chain) < 2:  # Skip metadata block
-        return chain
-    remaining_chain = [chain[0]] + [block for block in chain[1:] if block["vote"] != vote_to_remove]
-    if len(remaining_chain) <= 1:
-        return remaining_chain
-    for i in range(1, len(remaining_chain)):
-        remaining_chain[i]["prev_hash"] = remaining_chain[i-1]["hash"]
-        remaining_chain[i]["hash"] = hash_block(remaining_chain[i])
-    return remaining_chain
-
-def get_vote_counts(chain):
-    """Calculate vote counts per candidate"""
-    counts = {}
-    for block in chain[1:]:  # Skip metadata block
-        if "vote" in block:
-            counts[block["vote"]] = counts.get(block["vote"], 0) + 1
-    return counts
-
-def compare_with_official(official_results):
-    """Compare QR votes with official results"""
-    chain = load_chain(None)[1]
-    qr_counts = get_vote_counts(chain)
-    print("\nQR Vote Counts vs Official Results:")
-    for candidate, count in qr_counts.items():
-        official_count = official_results.get(candidate, 0)
-        difference = count - official_count
-        print(f"{candidate}: QR Votes = {count}, Official Votes = {official_count}, Difference = {difference}")
-
-def reset_chain():
-    """Reset the chain to empty"""
-    local_path = os.path.join(BASE_DIR, "vote_chain.json")
-    if os.path.exists(local_path):
-        os.remove(local_path)
-
-def main():
-    # Declare and initialize verbose at the start
-    global verbose
-    verbose = False  # Default to False
-    verbose = "--verb" in sys.argv or "--verbose" in sys.argv
-
-    # Initialize GitHub client
-    g = None
-    try:
-        if GITHUB_TOKEN:
-            g = Github(GITHUB_TOKEN)
-            log_verbose("GitHub authenticated, running in online mode.", verbose)
-        else:
-            log_verbose("No GITHUB_TOKEN, running in offline mode.", verbose)
-    except Exception as e:
-        log_verbose(f"GitHub authentication failed: {e}, running in offline mode.", verbose)
-
-    # Load existing chains
-    gist, gist_chain = load_chain(g, verbose) if g else (None, [])
-    _, local_chain = load_chain(None, verbose)
-    chain = merge_chains(local_chain, gist_chain)
-    log_verbose(f"Initial chain loaded. Blocks: {len(chain)}, First hash: {chain[1]['hash'] if len(chain) > 1 else 'N/A'}", verbose)
-
-    # Sync local chain with Gist if online
-    if g and gist:
-        chain = sync_local_chain(g, gist, local_chain, verbose)
-
-    # Parse stego, ascii, and verbose flags
-    steganography_message = None
-    ascii_mode = "--ascii" in sys.argv
-    if "--steg" in sys.argv or "--stego" in sys.argv:
-        flag = "--steg" if "--steg" in sys.argv else "--stego"
-        stego_index = sys.argv.index(flag)
-        if stego_index + 1 < len(sys.argv):
-            steganography_message = sys.argv[stego_index + 1]
-            sys.argv[stego_index:stego_index + 2] = []
-
-    # Parse election end time for genesis vote
-    global ELECTION_END_TIME
-    if len(chain) <= 1 and "--elec" not in sys.argv:  # Allow for metadata block
-        print("Error: Genesis vote requires --elec flag to set election end time (e.g., '240min' or '2025-06-15 18:00:00+00:00').")
-        return
-    if "--elec" in sys.argv:
-        elec_index = sys.argv.index("--elec")
-        if elec_index + 1 < len(sys.argv):
-            elec_input = sys.argv[elec_index + 1]
-            if not parse_election_end_time(elec_input):
-                return
-            # Add election end time to the first block for persistence
-            if len(chain) <= 1 and (not chain or "election_end_time" not in chain[0]):
-                chain.insert(0, {"election_end_time": ELECTION_END_TIME.isoformat()})
-            sys.argv[elec_index:elec_index + 2] = []
-        else:
-            print("Error: --elec requires a time value (e.g., '240min' or '2025-06-15 18:00:00+00:00').")
-            return
-
-    # Parse candidates from command line or positional arguments
-    allowed_candidates = []
-    if "--candidates" in sys.argv or "--opts" in sys.argv:
-        flag = "--candidates" if "--candidates" in sys.argv else "--opts"
-        candidates_index = sys.argv.index(flag)
-        allowed_candidates = [c for c in sys.argv[candidates_index + 1:] if not c.startswith("--")]
-        sys.argv[candidates_index:candidates_index + len(allowed_candidates) + 1] = []
-    elif len(sys.argv) > 1 and not any(arg.startswith("--") for arg in sys.argv[1:]):
-        allowed_candidates = [c for c in sys.argv[1:] if not c.startswith("--")]
-        sys.argv[1:] = []
-
-    # Check for scan mode, compare mode, reset, prune, or vote input
-    if len(sys.argv) > 1 and sys.argv[1] == "--scan":
-        if len(sys.argv) > 2:
-            qr_filename = sys.argv[2]
-            candidate = scan_and_vote(qr_filename, verbose)
-            if candidate:
-                prev_hash = chain[-1]["hash"] if chain and len(chain) > 1 and "hash" in chain[-1] else "genesis_hash"
-                new_block = add_vote(candidate, prev_hash)
-                chain.append(new_block)
-                url = save_chain(g, gist, chain, verbose)
-                is_valid, message = validate_chain(chain, verbose)
-                if verbose:
-                    log_verbose(f"New vote added:\n{json.dumps(new_block, indent=2)}", verbose)
-                if ascii_mode:
-                    if ascii_path := create_ascii_qr_code(candidate, verbose):
-                        if verbose:
-                            log_verbose(f"ASCII QR code saved at: {os.path.relpath(ascii_path, BASE_DIR)}", verbose)
-                else:
-                    if qr_path := create_qr_code(candidate, steganography_message, verbose):
-                        if verbose:
-                            log_verbose(f"QR code saved at: {os.path.relpath(qr_path, BASE_DIR)}", verbose)
-                if verbose:
-                    log_verbose(f"Updated Chain saved at: {url}", verbose)
-                print(f"Chain validation: {message}")
-        else:
-            print("Please provide a QR code filename with --scan, e.g., --scan qrcodes/qr_code_genesis_CandidateA_000001.png")
-    elif len(sys.argv) > 1 and sys.argv[1] == "--compare":
-        if len(sys.argv) > 2:
-            try:
-                official_results = json.loads(sys.argv[2])
-                compare_with_official(official_results)
-            except json.JSONDecodeError:
-                print("Invalid official results format. Use JSON, e.g., '{\"CandidateA\": 100, \"CandidateB\": 150}'")
-        else:
-            print("Please provide official results with --compare, e.g., --compare '{\"CandidateA\": 100, \"CandidateB\": 150}'")
-    elif len(sys.argv) > 1 and sys.argv[1] == "--reset":
-        reset_chain()
-        log_verbose("Local chain reset.", verbose)
-    elif len(sys.argv) > 1 and sys.argv[1] == "--prune":
-        if len(sys.argv) > 2:
-            vote_to_remove = sys.argv[2]
-            chain = prune_chain(chain, vote_to_remove)
-            url = save_chain(g, gist, chain, verbose)
-            is_valid, message = validate_chain(chain, verbose)
-            if verbose:
-                log_verbose(f"Removed vote for {vote_to_remove}", verbose)
-                log_verbose(f"Updated Chain saved at: {url}", verbose)
-            print(f"Chain validation: {message}")
-        else:
-            print("Please provide a vote to remove with --prune, e.g., --prune 'Candidate A'")
-    else:
-        if not allowed_candidates:
-            print("No candidates provided. Please run with --candidates flag or provide candidates as positional arguments, e.g., python qrvote.py 'Candidate A' 'Candidate B'")
-            return
-        while True:
-            vote = input(f"Select your vote ({', '.join(allowed_candidates)}) or scan a QR with --scan: ").strip()
-            if vote in allowed_candidates:
-                break
-            print(f"Invalid choice. Please select one of {', '.join(allowed_candidates)}.")
-        prev_hash = chain[-1]["hash"] if chain and len(chain) > 1 and "hash" in chain[-1] else "genesis_hash"
-        new_block = add_vote(vote, prev_hash)
-        chain.append(new_block)
-        url = save_chain(g, gist, chain, verbose)
-        is_valid, message = validate_chain(chain, verbose)
-        if verbose:
-            log_verbose(f"New vote added:\n{json.dumps(new_block, indent=2)}", verbose)
-        if ascii_mode:
-            if ascii_path := create_ascii_qr_code(vote, verbose):
-                if verbose:
-                    log_verbose(f"ASCII QR code saved at: {os.path.relpath(ascii_path, BASE_DIR)}", verbose)
-        else:
-            if qr_path := create_qr_code(vote, steganography_message, verbose):
-                if verbose:
-                    log_verbose(f"QR code saved at: {os.path.relpath(qr_path, BASE_DIR)}", verbose)
-        if verbose:
-            log_verbose(f"Updated Chain saved at: {url}", verbose)
-        print(f"Chain validation: {message}")
-
-if __name__ == "__main__":
+import json, hashlib, datetime, shutil, sys, time, re, os, heapq, queue, threading, atexit
+from collections import Counter, deque
+from contextlib import contextmanager
+from functools import lru_cache
+from operator import itemgetter
+
+# Heavy third-party modules (github, qrcode, PIL, pyzbar, stegano) are
+# imported lazily inside the functions that need them: PyGithub alone pulls
+# in requests/urllib3, and subcommands like --reset or --compare touch none
+# of them, so deferring the imports shaves a few hundred ms off cold start.
+
+# Optional: Install pyqrcode for ASCII support if not already installed
+try:
+    import pyqrcode
+    HAS_ASCII = True
+except ImportError:
+    HAS_ASCII = False
+
+# Configuration
+from dotenv import load_dotenv
+load_dotenv()
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Set base directory to script location
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN", "")
+GIST_FILENAME = os.getenv("GIST_FILENAME", "vote_chain.json")
+GIST_DESCRIPTION = os.getenv("GIST_DESCRIPTION", "QR Vote Street Talk Blockchain")
+
+# Election end time will be set dynamically for genesis vote
+ELECTION_END_TIME = None
+
+# Shared tzinfo so hot paths do not rebuild it; datetime.now(_UTC) is also
+# faster than the deprecated utcnow() + replace() dance
+_UTC = datetime.timezone.utc
+
+# Sentinel prev_hash of the first vote block; interned so the common
+# first-block comparison short-circuits on pointer equality
+GENESIS_HASH = sys.intern("genesis_hash")
+
+# Relative --elec durations like "240min"; compiled once at import, with the
+# unit mapped straight to the timedelta keyword
+_ELEC_RE = re.compile(r'^(\d+)(min|h|d)$')
+_ELEC_UNITS = {'min': 'minutes', 'h': 'hours', 'd': 'days'}
+
+def _derive_paths():
+    """(Re)compute the local file paths from BASE_DIR.
+
+    Joined once at import instead of per call; tests that repoint BASE_DIR
+    call this to refresh the derived constants."""
+    global CHAIN_PATH, CHAIN_LOG_PATH, VALIDATION_META_PATH, GIST_META_PATH, QR_DIR
+    CHAIN_PATH = os.path.join(BASE_DIR, "vote_chain.json")
+    CHAIN_LOG_PATH = os.path.join(BASE_DIR, "vote_chain.log")
+    VALIDATION_META_PATH = os.path.join(BASE_DIR, "vote_chain.meta.json")
+    GIST_META_PATH = os.path.join(BASE_DIR, ".gist_meta.json")
+    QR_DIR = os.path.join(BASE_DIR, "qrcodes")
+
+_derive_paths()
+
+@lru_cache(maxsize=1)
+def _stegano_lsb():
+    """Import stegano's lsb module on first use; None if unavailable"""
+    try:
+        from stegano import lsb
+        return lsb
+    except ImportError:
+        return None
+
+# Try to import numpy for the vectorized steganography path
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# Try to import segno, a faster pure-Python QR encoder with its own PNG writer
+try:
+    import segno
+    HAS_SEGNO = True
+except ImportError:
+    HAS_SEGNO = False
+
+# Try to import ijson to stream-parse large chain files block by block
+try:
+    import ijson
+    HAS_IJSON = True
+except ImportError:
+    HAS_IJSON = False
+
+# Try to import orjson for faster (de)serialization, fall back to stdlib json
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+def _dumps_canonical(obj):
+    """Serialize to canonical compact sorted-key JSON bytes (backend-independent)"""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+
+def _dumps_compact(obj):
+    """Serialize to compact JSON bytes"""
+    if HAS_ORJSON:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+def _dumps_indented(obj):
+    """Serialize to human-readable indented JSON bytes"""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode()
+
+def _loads(data):
+    """Parse JSON from str or bytes"""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+@lru_cache(maxsize=8)
+def _parse_election_end(raw):
+    """Parse an election_end_time string once per distinct value.
+
+    The same metadata string comes back on every chain load, so the
+    fromisoformat + tz replacement runs once per election, not per load."""
+    return datetime.datetime.fromisoformat(raw).replace(tzinfo=_UTC)
+
+def parse_election_end_time(elec_input):
+    """Parse election end time from --elec flag input."""
+    global ELECTION_END_TIME
+    now = datetime.datetime.now(_UTC)
+    
+    # Check for relative time (e.g., "240min", "4h", "2d")
+    match = _ELEC_RE.match(elec_input.strip().lower())
+    if match:
+        value, unit = int(match.group(1)), match.group(2)
+        ELECTION_END_TIME = now + datetime.timedelta(**{_ELEC_UNITS[unit]: value})
+        return True
+    
+    # Check for absolute time (e.g., "2025-06-15 18:00:00+00:00")
+    try:
+        ELECTION_END_TIME = datetime.datetime.fromisoformat(elec_input.replace(' ', 'T')).replace(tzinfo=_UTC)
+        if ELECTION_END_TIME <= now:
+            print("Error: Election end time must be in the future.")
+            return False
+        return True
+    except ValueError:
+        print("Error: Invalid time format. Use '240min', '4h', '2d', or 'YYYY-MM-DD HH:MM:SS+00:00'.")
+        return False
+
+def log_verbose(msg, verbose=False):
+    """Log message with timestamp only in verbose mode."""
+    if verbose:
+        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}")
+    else:
+        print(msg)
+
+@contextmanager
+def show_loading(message="Processing..."):
+    """Animate a spinner in a background thread while the wrapped work runs.
+
+    The old version slept a fixed two wall-clock seconds per call on the
+    critical path; this one adds no latency - the animation stops the moment
+    the with-block finishes."""
+    stop = threading.Event()
+
+    def _animate():
+        animation = ["|", "/", "-", "\\"]
+        frame = 0
+        while not stop.is_set():
+            sys.stdout.write(f"\r{message} {animation[frame % 4]}")
+            sys.stdout.flush()
+            frame += 1
+            stop.wait(0.2)
+        sys.stdout.write("\r" + " " * 50 + "\r")  # Clear the line
+        sys.stdout.flush()
+
+    spinner = threading.Thread(target=_animate, daemon=True)
+    spinner.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        spinner.join()
+
+# Canonical block fields covered by the hash, in sorted key order
+_CANONICAL_FIELDS = ("prev_hash", "timestamp", "vote")
+# Memoized digests keyed by the (prev_hash, timestamp, vote) content tuple,
+# so hits survive reloads and block-dict mutation or id reuse cannot alias
+_HASH_CACHE = {}
+
+def _canonical_bytes(prev_hash, timestamp, vote):
+    """Build the canonical block bytes directly from the three hashed fields.
+
+    Byte-for-byte identical to _dumps_canonical on the equivalent dict (the
+    keys are already in sorted order) without allocating or sorting a dict.
+    prev_hash (a hex digest or the genesis sentinel) and timestamp (ISO 8601)
+    never contain characters that need JSON escaping, so they are quoted
+    literally; only the free-form vote string goes through the encoder."""
+    if HAS_ORJSON:
+        vote_json = orjson.dumps(vote)
+    else:
+        vote_json = json.dumps(vote, ensure_ascii=False).encode()
+    return (b'{"prev_hash":"' + prev_hash.encode() +
+            b'","timestamp":"' + timestamp.encode() +
+            b'","vote":' + vote_json + b'}')
+
+def hash_block(block):
+    """Calculate SHA-256 hash of a block's canonical fields, memoized by content"""
+    fingerprint = tuple(block[f] for f in _CANONICAL_FIELDS)
+    digest = _HASH_CACHE.get(fingerprint)
+    if digest is None:
+        digest = hashlib.sha256(_canonical_bytes(*fingerprint)).hexdigest()
+        _HASH_CACHE[fingerprint] = digest
+    return digest
+
+# Below this many blocks, pool startup costs more than serial hashing saves
+_PARALLEL_THRESHOLD = 256
+
+def hash_blocks(blocks):
+    """Hash a batch of blocks, reusing cached digests.
+
+    hashlib.sha256 already dispatches to OpenSSL's hardware-accelerated
+    (SHA-NI/AVX2) implementation, so batching here strips the per-call
+    Python overhead; large batches are additionally sharded across a
+    thread pool since each block's digest is independent."""
+    if len(blocks) >= _PARALLEL_THRESHOLD:
+        from concurrent.futures import ThreadPoolExecutor
+        workers = int(os.getenv("QRVOTE_WORKERS", 0)) or os.cpu_count() or 1
+        chunk_size = -(-len(blocks) // workers)
+        shards = [blocks[i:i + chunk_size] for i in range(0, len(blocks), chunk_size)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            digests = []
+            for shard_digests in pool.map(_hash_blocks_serial, shards):
+                digests.extend(shard_digests)
+        return digests
+    return _hash_blocks_serial(blocks)
+
+def _hash_blocks_serial(blocks):
+    """Hash a slice of blocks in one tight loop with hoisted locals"""
+    sha256 = hashlib.sha256
+    canonical_bytes = _canonical_bytes
+    cache = _HASH_CACHE
+    digests = []
+    for block in blocks:
+        fingerprint = tuple(block[f] for f in _CANONICAL_FIELDS)
+        digest = cache.get(fingerprint)
+        if digest is None:
+            digest = sha256(canonical_bytes(*fingerprint)).hexdigest()
+            cache[fingerprint] = digest
+        digests.append(digest)
+    return digests
+
+class ChainColumns:
+    """Struct-of-arrays view of a chain's vote blocks.
+
+    Four parallel lists cost far less memory than one dict per block and let
+    columnar passes (linkage checks, tallies) run as single C-level list
+    operations. The on-disk format is unchanged: build a view with
+    from_blocks() and go back to dicts with to_blocks()."""
+    __slots__ = ("votes", "timestamps", "prev_hashes", "hashes")
+
+    def __init__(self, votes, timestamps, prev_hashes, hashes):
+        self.votes = votes
+        self.timestamps = timestamps
+        self.prev_hashes = prev_hashes
+        self.hashes = hashes
+
+    @classmethod
+    def from_blocks(cls, chain):
+        """Build columns from a block list, skipping non-vote (metadata) blocks"""
+        votes, timestamps, prev_hashes, hashes = [], [], [], []
+        for block in chain:
+            if "vote" in block:
+                votes.append(block["vote"])
+                timestamps.append(block["timestamp"])
+                prev_hashes.append(block["prev_hash"])
+                hashes.append(block.get("hash"))
+        return cls(votes, timestamps, prev_hashes, hashes)
+
+    def to_blocks(self):
+        """Rebuild the list-of-dicts block representation"""
+        return [{"vote": v, "timestamp": t, "prev_hash": p, "hash": h}
+                for v, t, p, h in zip(self.votes, self.timestamps, self.prev_hashes, self.hashes)]
+
+# Parsed Gist chains keyed by gist id, invalidated via updated_at
+_GIST_CACHE = {}
+
+def _load_gist_chain(gist):
+    """Parse the gist's chain once per updated_at stamp, caching the result"""
+    stamp = gist.updated_at.isoformat() if gist.updated_at else None
+    cached = _GIST_CACHE.get(gist.id)
+    if cached is not None and cached[0] == stamp:
+        return list(cached[1])  # Shallow copy so callers can reshape the list
+    content = gist.files[GIST_FILENAME].content
+    chain = _loads(content) if content else []
+    _GIST_CACHE[gist.id] = (stamp, chain)
+    return list(chain)
+
+def _read_gist_meta():
+    """Read the cached gist id / updated_at stamp; empty dict when absent"""
+    try:
+        with open(GIST_META_PATH, "rb") as f:
+            meta = _loads(f.read())
+        return meta if isinstance(meta, dict) else {}
+    except Exception:
+        return {}
+
+def _write_gist_meta(gist, synced=False):
+    """Persist the gist id, plus its updated_at stamp once the local copy
+    reflects the gist, so the next run can skip the scan and the download"""
+    meta = {"id": gist.id}
+    if synced and gist.updated_at:
+        meta["updated_at"] = gist.updated_at.isoformat()
+    meta_path = GIST_META_PATH
+    try:
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_dumps_compact(meta))
+        os.replace(tmp_path, meta_path)  # Atomic: never a half-written cache
+    except OSError:
+        pass
+
+def _find_gist(g):
+    """Locate the vote-chain gist, fetching by cached gist id when possible.
+
+    user.get_gists() is paginated - one HTTPS round trip per page - so the
+    first discovery stores the gist id in .gist_meta.json and later runs do a
+    single direct GET instead of enumerating every gist."""
+    gist_id = _read_gist_meta().get("id")
+    try:
+        if gist_id:
+            gist = g.get_gist(gist_id)
+            if GIST_FILENAME in gist.files:
+                return gist
+    except Exception:
+        pass  # Missing or stale cache: fall back to the full scan
+    for gist in g.get_user().get_gists():
+        if GIST_FILENAME in gist.files:
+            _write_gist_meta(gist)
+            return gist
+    return None
+
+def load_chain(g, verbose=False):
+    """Load the vote chain from Gist or local file and set ELECTION_END_TIME if present"""
+    global ELECTION_END_TIME
+    try:
+        if g:
+            gist = _find_gist(g)
+            if gist is not None:
+                stamp = gist.updated_at.isoformat() if gist.updated_at else None
+                if stamp and stamp == _read_gist_meta().get("updated_at") and os.path.exists(CHAIN_PATH):
+                    # Gist untouched since the last sync, so the local copy is
+                    # a superset of it: reuse that and skip the content
+                    # download and parse entirely
+                    _, chain = load_chain(None, verbose)
+                    return gist, chain
+                chain = _load_gist_chain(gist)
+                if chain and "election_end_time" in chain[0]:
+                    ELECTION_END_TIME = _parse_election_end(chain[0]["election_end_time"])
+                return gist, chain
+        chain = []
+        try:
+            # try/open over exists-then-open: one syscall, no TOCTOU window
+            f = open(CHAIN_PATH, "rb", buffering=65536)
+        except FileNotFoundError:
+            pass  # The append log may still hold blocks
+        else:
+            with f:
+                if HAS_IJSON and os.fstat(f.fileno()).st_size > 0:
+                    # Stream one block at a time: peak memory stays at a parser
+                    # buffer instead of file text plus the fully parsed list
+                    chain = list(ijson.items(f, "item"))
+                else:
+                    content = f.read().strip()
+                    chain = _loads(content) if content else []
+        try:
+            with open(CHAIN_LOG_PATH, "rb", buffering=65536) as f:
+                # Blocks appended since the last compaction live in the log
+                chain.extend(_loads(line) for line in f if line.strip())
+        except FileNotFoundError:
+            pass
+        if chain and "election_end_time" in chain[0]:
+            ELECTION_END_TIME = _parse_election_end(chain[0]["election_end_time"])
+        return None, chain
+    except Exception as e:
+        log_verbose(f"Error loading chain: {e}", verbose)
+        return None, []
+
+def load_tip_hash(verbose=False):
+    """Return the hash of the last block in the local chain, or the genesis
+    sentinel when there is none.
+
+    With ijson available only one block is ever materialized, so appending to
+    a huge chain does not require parsing it into memory first."""
+    try:
+        if HAS_IJSON and os.path.exists(CHAIN_PATH) and os.path.getsize(CHAIN_PATH) > 0:
+            with open(CHAIN_PATH, "rb", buffering=65536) as f:
+                last = deque(ijson.items(f, "item"), maxlen=1)
+            block = last[0] if last else None
+        else:
+            _, chain = load_chain(None, verbose)
+            block = chain[-1] if chain else None
+        if block and "hash" in block:
+            return block["hash"]
+    except Exception as e:
+        log_verbose(f"Error reading tip hash: {e}", verbose)
+    return GENESIS_HASH
+
+def append_votes(blocks, verbose=False):
+    """Append new blocks to the local JSONL log in O(1) writes per vote.
+
+    Rewriting vote_chain.json costs O(N) bytes per vote; offline votes land
+    as one compact JSON line each instead, and the next full save_chain
+    folds them back into the main file. Returns the log path, or None on
+    failure so callers can fall back to a full save."""
+    try:
+        with open(CHAIN_LOG_PATH, "ab") as f:
+            for block in blocks:
+                f.write(_dumps_compact(block) + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        log_verbose(f"Appended {len(blocks)} block(s) to {CHAIN_LOG_PATH}", verbose)
+        return CHAIN_LOG_PATH
+    except Exception as e:
+        log_verbose(f"Error appending to chain log: {e}", verbose)
+        return None
+
+def _clear_chain_log():
+    """Drop the JSONL log once its blocks are compacted into vote_chain.json"""
+    try:
+        os.remove(CHAIN_LOG_PATH)
+    except OSError:
+        pass
+
+def sync_local_chain(g, gist, local_chain, verbose=False):
+    """Sync local vote_chain.json with the latest Gist data, merging with local changes"""
+    if g and gist:
+        try:
+            with show_loading("Syncing with Gist..."):
+                gist_chain = _load_gist_chain(gist)
+                merged_chain = merge_chains(local_chain, gist_chain)
+            with open(CHAIN_PATH, "wb", buffering=65536) as f:
+                f.write(_dumps_compact(merged_chain))
+            _clear_chain_log()
+            _write_gist_meta(gist, synced=True)
+            log_verbose(f"Local chain synced with Gist. Blocks: {len(merged_chain)}, First hash: {merged_chain[1]['hash'] if len(merged_chain) > 1 else 'N/A'}", verbose)
+            return merged_chain
+        except Exception as e:
+            log_verbose(f"Error syncing local chain: {e}", verbose)
+            return local_chain
+    return local_chain
+
+def add_vote(candidate, prev_hash):
+    """Create a new vote block"""
+    block = {
+        "vote": candidate,
+        "timestamp": datetime.datetime.now(_UTC).isoformat(),
+        "prev_hash": prev_hash
+    }
+    block["hash"] = hash_block(block)
+    return block
+
+def _lsb_hide(image, message):
+    """Embed a message in the image's least-significant bit plane.
+
+    With numpy available this is one vectorized pass over the pixel buffer
+    (orders of magnitude faster than per-pixel Python); otherwise fall back
+    to stegano's implementation. The two encodings are not interchangeable,
+    so extract with _lsb_reveal from the same install."""
+    if HAS_NUMPY:
+        from PIL import Image
+        arr = np.array(image.convert("RGB"))
+        bits = np.unpackbits(np.frombuffer(message.encode() + b"\x00", dtype=np.uint8))
+        flat = arr.reshape(-1)
+        if bits.size > flat.size:
+            raise ValueError("Message too long for carrier image")
+        flat[:bits.size] = (flat[:bits.size] & 0xFE) | bits
+        return Image.fromarray(arr)
+    return _stegano_lsb().hide(image, message)
+
+def _lsb_reveal(image):
+    """Extract a message embedded by _lsb_hide, or None if there is none"""
+    if HAS_NUMPY:
+        flat = np.array(image.convert("RGB")).reshape(-1)
+        data = np.packbits(flat & 1).tobytes()
+        end = data.find(b"\x00")
+        message = data[:end] if end >= 0 else data
+        return message.decode(errors="replace") or None
+    return _stegano_lsb().reveal(image)
+
+@lru_cache(maxsize=1)
+def _qr_generator():
+    """Build the configured qrcode.QRCode once; callers clear() between uses"""
+    import qrcode
+    return qrcode.QRCode(
+        version=2,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=10,
+        border=4
+    )
+
+def create_qr_code(candidate, steganography_message=None, verbose=False):
+    try:
+        qr_data = f"genesis:{candidate}"
+        qr_filename = f"qr_code_genesis_{candidate.replace(' ', '_')}_000001.png"
+        qr_path = os.path.join(QR_DIR, qr_filename)
+        os.makedirs(QR_DIR, exist_ok=True)
+
+        if HAS_SEGNO and not steganography_message:
+            # segno encodes and writes the PNG itself - no PIL image object,
+            # no libpng round trip. The stego path still needs the in-memory
+            # PIL image, so it keeps the qrcode backend below.
+            with show_loading("Generating QR code..."):
+                segno.make(qr_data, error="h").save(qr_path, scale=10, border=4)
+            log_verbose(f"QR code generated at: {qr_path}", verbose)
+            return qr_path
+
+        with show_loading("Generating QR code..."):
+            qr = _qr_generator()
+            qr.clear()
+            qr.version = 2  # make(fit=True) may have grown it on a previous call
+            qr.add_data(qr_data)
+            qr.make(fit=True)
+            qr_image = qr.make_image(fill_color="black", back_color="white")
+
+        if steganography_message and (HAS_NUMPY or _stegano_lsb() is not None):
+            MIN_LENGTH = 1
+            MAX_LENGTH = 100
+            # The QR is a tiny monochrome image: zlib level 1 without the
+            # optimize pass encodes several times faster for a few extra bytes
+            qr_image_rgb = qr_image.convert("RGB")
+            qr_image_rgb.save(qr_path, optimize=False, compress_level=1)
+            log_verbose(f"QR code generated at: {qr_path}", verbose)
+            if not (MIN_LENGTH <= len(steganography_message) <= MAX_LENGTH):
+                return qr_path
+            # Create stego file discreetly without announcing; embed from the
+            # in-memory RGB image rather than re-reading the file just written
+            stego_path = os.path.join(QR_DIR, f"stego_{qr_filename}")
+            with show_loading("Embedding steganography..."):
+                secret_image = _lsb_hide(qr_image_rgb, steganography_message)
+                secret_image.save(stego_path, optimize=False, compress_level=1)
+            # Return original QR path to avoid mentioning stego
+            return qr_path
+
+        qr_image.save(qr_path, optimize=False, compress_level=1)
+        log_verbose(f"QR code generated at: {qr_path}", verbose)
+        return qr_path
+    except Exception as e:
+        log_verbose(f"Error generating QR code or steganography: {e}", verbose)
+        return None
+
+def create_ascii_qr_code(candidate, verbose=False):
+    if not HAS_ASCII:
+        log_verbose("ASCII QR code generation requires 'pyqrcode' library. Please install it with 'pip install pyqrcode'", verbose)
+        return None
+    try:
+        qr_data = f"genesis:{candidate}"
+        with show_loading("Generating ASCII QR code..."):
+            qr = pyqrcode.create(qr_data, error='H', version=2)
+            ascii_art = qr.terminal(module_color=0, background=7, quiet_zone=1)
+        ascii_filename = f"qr_code_genesis_{candidate.replace(' ', '_')}_000001.txt"
+        ascii_path = os.path.join(QR_DIR, ascii_filename)
+        os.makedirs(QR_DIR, exist_ok=True)
+        with open(ascii_path, "w") as f:
+            f.write(ascii_art)
+        log_verbose(f"ASCII QR code saved at: {ascii_path}", verbose)
+        return ascii_path
+    except Exception as e:
+        log_verbose(f"Error generating ASCII QR code: {e}", verbose)
+        return None
+
+def _decode_qr_candidate(image):
+    """Decode a QR image and return its candidate payload, or None.
+
+    zbar only looks at luminance, so decode an 8bpp grayscale view instead
+    of letting it force-load the full RGB(A) image, and restrict the symbol
+    search to QR codes so zbar skips its other barcode decoders."""
+    from pyzbar.pyzbar import decode, ZBarSymbol
+    decoded_objects = decode(image.convert("L"), symbols=[ZBarSymbol.QRCODE])
+    if not decoded_objects:
+        return None
+    qr_data = decoded_objects[0].data.decode()
+    if qr_data.startswith("genesis:"):
+        return qr_data[len("genesis:"):]
+    return None
+
+def scan_qr_codes(qr_filenames, verbose=False):
+    """Scan a batch of QR images, returning (filename, candidate) pairs.
+
+    Amortizes the PIL/pyzbar setup across files for bulk audits; candidates
+    decode to None for unreadable or non-vote images."""
+    from PIL import Image
+    results = []
+    for qr_filename in qr_filenames:
+        try:
+            with Image.open(qr_filename) as image:
+                results.append((qr_filename, _decode_qr_candidate(image)))
+        except Exception as e:
+            log_verbose(f"Error scanning QR code {qr_filename}: {e}", verbose)
+            results.append((qr_filename, None))
+    return results
+
+def scan_and_vote(qr_filename, verbose=False):
+    """Scan a QR code and handle vote"""
+    try:
+        from PIL import Image
+        # The context manager releases the file descriptor promptly under
+        # repeated scanning
+        with Image.open(qr_filename) as image:
+            candidate = _decode_qr_candidate(image)
+        if candidate is None:
+            return None
+        current_time = datetime.datetime.now(_UTC)
+        if ELECTION_END_TIME and current_time > ELECTION_END_TIME:
+            print(f"Election ended at {ELECTION_END_TIME}. No further votes accepted.")
+            return None
+        return candidate
+    except Exception as e:
+        log_verbose(f"Error scanning QR code: {e}", verbose)
+        return None
+
+def validate_chain(chain, verbose=False, start=0):
+    """Validate the vote chain with optional verbose output, skipping non-vote blocks.
+
+    When `start` > 0 the first `start` vote blocks are assumed already
+    validated (see the vote_chain.meta.json cursor) and only the tail is
+    re-checked, so per-vote validation cost stays O(1) on append."""
+    try:
+        vote_blocks = [block for block in chain if "vote" in block] if chain else []
+        if not vote_blocks:  # No votes to validate
+            return True, "Chain is valid (no vote blocks)"
+        first = min(max(1, start), len(vote_blocks))
+        # Phase 1: settle prev_hash linkage with one C-level list compare
+        # before paying for any hashing; on mismatch, locate and report the
+        # first broken link without recomputing a single digest
+        columns = ChainColumns.from_blocks(vote_blocks)
+        prevs = columns.prev_hashes[first:]
+        expected_prevs = columns.hashes[first - 1:len(columns.hashes) - 1]
+        if prevs != expected_prevs:
+            bad = next(i for i, (a, b) in enumerate(zip(prevs, expected_prevs)) if a != b) + first
+            block = vote_blocks[bad]
+            if verbose:
+                log_verbose(f"Validation failed at block {chain.index(block)+1}: prev_hash {block['prev_hash']} != {vote_blocks[bad-1]['hash']}", verbose)
+            return False, f"Invalid prev_hash at block {chain.index(block)+1}"
+        # Phase 2: recompute digests for the tail only
+        tail = vote_blocks[first:]
+        calculated_hashes = hash_blocks(tail)
+        for i, block in enumerate(tail, first):
+            current_hash = block["hash"]
+            calculated_hash = calculated_hashes[i - first]
+            if current_hash != calculated_hash:
+                if verbose:
+                    log_verbose(f"Validation failed at block {chain.index(block)+1}: stored hash {current_hash} != calculated {calculated_hash}", verbose)
+                return False, f"Invalid hash at block {chain.index(block)+1}"
+        if start <= 0 and vote_blocks[0]["prev_hash"] != GENESIS_HASH:
+            if verbose:
+                log_verbose(f"Validation failed at block {chain.index(vote_blocks[0])+1}: prev_hash {vote_blocks[0]['prev_hash']} != genesis_hash", verbose)
+            return False, f"Invalid genesis hash at block {chain.index(vote_blocks[0])+1}"
+        return True, "Chain is valid"
+    except Exception as e:
+        if verbose:
+            log_verbose(f"Validation error: {e}", verbose)
+        return False, f"Validation error: {str(e)}"
+
+def load_validation_start(chain):
+    """Return the vote-block index validation can resume from, per the sidecar meta"""
+    try:
+        with open(VALIDATION_META_PATH, "rb") as f:
+            meta = _loads(f.read())
+        validated = meta["validated_up_to"]
+        vote_blocks = [block for block in chain if "vote" in block]
+        if 0 < validated <= len(vote_blocks) and vote_blocks[validated - 1]["hash"] == meta["tip_hash"]:
+            return validated
+    except Exception:
+        pass
+    return 0
+
+def save_validation_meta(chain):
+    """Atomically record how far the chain has been validated"""
+    meta_path = VALIDATION_META_PATH
+    vote_blocks = [block for block in chain if "vote" in block]
+    if not vote_blocks:
+        reset_validation_meta()
+        return
+    meta = {"validated_up_to": len(vote_blocks), "tip_hash": vote_blocks[-1]["hash"]}
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_dumps_indented(meta))
+    os.replace(tmp_path, meta_path)
+
+def reset_validation_meta():
+    """Drop the validation cursor so the next validation covers the full chain"""
+    try:
+        os.remove(VALIDATION_META_PATH)
+    except FileNotFoundError:
+        pass
+
+# Background gist uploader: created on first use, coalesces queued snapshots
+# so a burst of votes costs a single gist.edit round trip
+_gist_queue = None
+
+def _gist_worker():
+    while True:
+        gist, content = _gist_queue.get()
+        # Drain anything queued behind this snapshot; only the newest matters
+        try:
+            while True:
+                gist, content = _gist_queue.get_nowait()
+                _gist_queue.task_done()
+        except queue.Empty:
+            pass
+        try:
+            from github import InputFileContent
+            gist.edit(files={GIST_FILENAME: InputFileContent(content)})
+            _write_gist_meta(gist, synced=True)
+        except Exception as e:
+            log_verbose(f"Background Gist update failed: {e}")
+        finally:
+            _gist_queue.task_done()
+
+def _queue_gist_update(gist, content):
+    """Hand a chain snapshot to the background uploader.
+
+    Returns immediately unless the queue's backpressure limit is hit; pending
+    uploads are flushed before interpreter exit via Queue.join."""
+    global _gist_queue
+    if _gist_queue is None:
+        _gist_queue = queue.Queue(maxsize=32)
+        threading.Thread(target=_gist_worker, daemon=True).start()
+        atexit.register(_gist_queue.join)
+    _gist_queue.put((gist, content))
+
+def save_chain(g, gist, chain, verbose=False, pretty=False):
+    """Save the vote chain to Gist or local file.
+
+    The compact form roughly halves the bytes written and uploaded; pass
+    pretty=True (--pretty on the CLI) for a human-readable local copy."""
+    try:
+        data = _dumps_indented(chain) if pretty else _dumps_compact(chain)
+        with open(CHAIN_PATH, "wb", buffering=65536) as f:
+            f.write(data)
+        _clear_chain_log()  # The full file now holds everything the log did
+        if g and gist:
+            content = data.decode()
+            log_verbose(f"Queueing Gist update with content: {content[:50]}...", verbose)
+            # The HTTPS round trip happens off the critical path; the worker
+            # stamps .gist_meta.json once the edit lands
+            _queue_gist_update(gist, content)
+            log_verbose(f"Gist update queued for: {gist.html_url}", verbose)
+            return gist.html_url
+        log_verbose(f"Chain saved locally at: {CHAIN_PATH}", verbose)
+        return CHAIN_PATH
+    except Exception as e:
+        log_verbose(f"Error saving chain to Gist or local file: {e}", verbose)
+        return None
+
+def _is_sorted(blocks, key):
+    """True if blocks are already in non-decreasing key order"""
+    return all(key(blocks[i]) <= key(blocks[i + 1]) for i in range(len(blocks) - 1))
+
+def merge_chains(local_chain, gist_chain):
+    """Merge local and Gist chains, preserving existing hashes and metadata block"""
+    if not gist_chain and not local_chain:
+        return []
+    base_chain = gist_chain if gist_chain else local_chain
+    if not base_chain:
+        return []
+    
+    # Preserve metadata block if present
+    metadata = None
+    if base_chain and "election_end_time" in base_chain[0]:
+        metadata = base_chain[0]
+        base_chain = base_chain[1:]
+    
+    timestamp_key = itemgetter("timestamp")
+    presorted = False
+    if local_chain and gist_chain and local_chain != gist_chain:
+        gist_tail = [b for b in gist_chain[1:] if "vote" in b]
+        local_tail = [b for b in local_chain[1:] if "vote" in b]
+        if _is_sorted(gist_tail, timestamp_key) and _is_sorted(local_tail, timestamp_key):
+            # Both chains are append-only and already timestamp-ordered, so a
+            # single O(M+N) heapq.merge replaces the concatenation plus sort;
+            # merge is stable, keeping gist precedence for duplicate keys
+            combined_chain = heapq.merge(gist_tail, local_tail, key=timestamp_key)
+            presorted = True
+        else:
+            combined_chain = gist_tail + local_tail
+    else:
+        combined_chain = base_chain
+    
+    seen = set()
+    seen_add = seen.add
+    unique_chain = []
+    unique_append = unique_chain.append
+    for block in combined_chain:
+        if "vote" in block:  # Only consider blocks with vote data
+            key = (block["vote"], block["timestamp"])
+            if key not in seen:
+                unique_append(block)
+                seen_add(key)
+    
+    if not unique_chain:
+        return [metadata] if metadata else []
+    
+    if not presorted:
+        unique_chain.sort(key=timestamp_key)
+    # Re-link with a rolling previous digest carried in a local; blocks whose
+    # prev_hash already matches keep their stored hash untouched, the rest get
+    # rehashed so the stored digest stays consistent with the new link
+    prev = GENESIS_HASH
+    for block in unique_chain:
+        if block.get("prev_hash") != prev:
+            block["prev_hash"] = prev
+            block["hash"] = hash_block(block)
+        prev = block["hash"]
+
+    return [metadata] + unique_chain if metadata else unique_chain
+
+def prune_chain(chain, vote_to_remove):
+    """Remove a specific vote and rebuild the chain"""
+    if not chain or len(chain) < 2:  # Skip metadata block
+        return chain
+    first = next((i for i, block in enumerate(chain[1:], 1) if block["vote"] == vote_to_remove), None)
+    if first is None:
+        return chain  # Vote not present; every link and digest still holds
+    remaining_chain = chain[:first] + [block for block in chain[first:] if block["vote"] != vote_to_remove]
+    if len(remaining_chain) <= 1:
+        return remaining_chain
+    # Links before the first removal are untouched, so only the suffix is
+    # re-linked, with the rolling previous digest carried in a local
+    prev = remaining_chain[first - 1]["hash"] if first > 1 else GENESIS_HASH
+    for block in remaining_chain[first:]:
+        block["prev_hash"] = prev
+        prev = block["hash"] = hash_block(block)
+    return remaining_chain
+
+# Last tally, keyed by (chain length, tip hash): append, prune, and merge
+# all move at least one of the two, so a key hit means the votes are unchanged
+_VOTE_COUNT_CACHE = (None, None)
+
+def get_vote_counts(chain):
+    """Calculate vote counts per candidate, memoized per chain tip"""
+    global _VOTE_COUNT_CACHE
+    key = (len(chain), chain[-1].get("hash") if chain else None)
+    cached_key, cached_counts = _VOTE_COUNT_CACHE
+    if cached_key == key:
+        return dict(cached_counts)
+    # Counter runs in C over the contiguous votes column; metadata blocks are
+    # already filtered out by ChainColumns
+    counts = Counter(ChainColumns.from_blocks(chain).votes)
+    _VOTE_COUNT_CACHE = (key, counts)
+    return dict(counts)
+
+def compare_with_official(official_results):
+    """Compare QR votes with official results"""
+    chain = load_chain(None)[1]
+    qr_counts = get_vote_counts(chain)
+    print("\nQR Vote Counts vs Official Results:")
+    for candidate, count in qr_counts.items():
+        official_count = official_results.get(candidate, 0)
+        difference = count - official_count
+        print(f"{candidate}: QR Votes = {count}, Official Votes = {official_count}, Difference = {difference}")
+
+def reset_chain():
+    """Reset the chain to empty"""
+    try:
+        os.remove(CHAIN_PATH)
+    except OSError:
+        pass
+    _clear_chain_log()
+    reset_validation_meta()
+
+def _build_arg_parser():
+    """One argparse pass replaces the old repeated sys.argv scans and splices"""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="qrvote.py",
+        description="Blockchain-inspired voting with QR codes and Gist sync.")
+    parser.add_argument("candidates", nargs="*", metavar="CANDIDATE",
+                        help="allowed candidates for an interactive vote")
+    parser.add_argument("--candidates", "--opts", dest="candidate_opts", nargs="+",
+                        metavar="CANDIDATE", help="allowed candidates (flag form)")
+    parser.add_argument("--elec", metavar="WHEN",
+                        help="election end time for the genesis vote, e.g. '240min' or '2025-06-15 18:00:00+00:00'")
+    parser.add_argument("--scan", metavar="FILE",
+                        help="scan a QR code image and record its vote")
+    parser.add_argument("--scan-batch", dest="scan_batch", metavar="DIR",
+                        help="scan every .png in a directory and record all votes in one save")
+    parser.add_argument("--regen-qr", dest="regen_qr", action="store_true",
+                        help="with --scan, copy the scanned QR into qrcodes/ under the canonical name")
+    parser.add_argument("--compare", metavar="JSON",
+                        help="compare the tally with official results")
+    parser.add_argument("--reset", action="store_true", help="reset the local chain")
+    parser.add_argument("--prune", metavar="CANDIDATE",
+                        help="remove a vote and rebuild the chain")
+    parser.add_argument("--steg", "--stego", dest="steg", metavar="MESSAGE",
+                        help="embed a hidden message alongside the generated QR code")
+    parser.add_argument("--ascii", dest="ascii_mode", action="store_true",
+                        help="emit an ASCII QR code instead of a PNG")
+    parser.add_argument("--pretty", action="store_true",
+                        help="write vote_chain.json indented instead of compact")
+    parser.add_argument("--no-sync", dest="no_sync", action="store_true",
+                        help="keep the chain local; skip the Gist push")
+    parser.add_argument("--verb", "--verbose", dest="verbose", action="store_true",
+                        help="verbose output")
+    return parser
+
+def _record_votes(g, gist, chain, new_blocks, verbose, pretty_mode, no_sync):
+    """Persist freshly appended vote blocks and revalidate the tail.
+
+    Online pushes rewrite the full file (and queue the gist edit); offline
+    appends go through the JSONL log unless a pretty copy was requested."""
+    if gist and not no_sync:
+        url = save_chain(g, gist, chain, verbose, pretty_mode)
+    elif pretty_mode or not os.path.exists(CHAIN_PATH):
+        # A pretty copy was asked for, or this is the genesis save and the
+        # metadata block needs to reach the main file, not just the log
+        url = save_chain(None, None, chain, verbose, pretty_mode)
+    else:
+        url = append_votes(new_blocks, verbose) or save_chain(None, None, chain, verbose, pretty_mode)
+    is_valid, message = validate_chain(chain, verbose, start=load_validation_start(chain))
+    if is_valid:
+        save_validation_meta(chain)
+    return url, message
+
+def main():
+    # Declare and initialize verbose at the start
+    global verbose
+    args = _build_arg_parser().parse_args()
+    verbose = args.verbose
+
+    # Initialize GitHub client
+    g = None
+    try:
+        if GITHUB_TOKEN:
+            from github import Github
+            g = Github(GITHUB_TOKEN)
+            log_verbose("GitHub authenticated, running in online mode.", verbose)
+        else:
+            log_verbose("No GITHUB_TOKEN, running in offline mode.", verbose)
+    except Exception as e:
+        log_verbose(f"GitHub authentication failed: {e}, running in offline mode.", verbose)
+
+    # Load existing chains
+    gist, gist_chain = load_chain(g, verbose) if g else (None, [])
+    _, local_chain = load_chain(None, verbose)
+    chain = merge_chains(local_chain, gist_chain)
+    log_verbose(f"Initial chain loaded. Blocks: {len(chain)}, First hash: {chain[1]['hash'] if len(chain) > 1 else 'N/A'}", verbose)
+
+    # Sync local chain with Gist if online
+    if g and gist:
+        chain = sync_local_chain(g, gist, local_chain, verbose)
+
+    steganography_message = args.steg
+    ascii_mode = args.ascii_mode
+    pretty_mode = args.pretty
+    no_sync = args.no_sync
+
+    # Parse election end time for genesis vote
+    global ELECTION_END_TIME
+    casting_vote = not (args.compare or args.reset or args.prune)
+    if casting_vote and len(chain) <= 1 and not args.elec:  # Allow for metadata block
+        print("Error: Genesis vote requires --elec flag to set election end time (e.g., '240min' or '2025-06-15 18:00:00+00:00').")
+        return
+    if args.elec:
+        if not parse_election_end_time(args.elec):
+            return
+        # Add election end time to the first block for persistence
+        if len(chain) <= 1 and (not chain or "election_end_time" not in chain[0]):
+            chain.insert(0, {"election_end_time": ELECTION_END_TIME.isoformat()})
+
+    allowed_candidates = args.candidate_opts or args.candidates
+
+    # Dispatch on scan mode, compare mode, reset, prune, or vote input
+    if args.scan:
+        qr_filename = args.scan
+        candidate = scan_and_vote(qr_filename, verbose)
+        if candidate:
+            prev_hash = chain[-1]["hash"] if chain and len(chain) > 1 and "hash" in chain[-1] else GENESIS_HASH
+            new_block = add_vote(candidate, prev_hash)
+            chain.append(new_block)
+            url, message = _record_votes(g, gist, chain, [new_block], verbose, pretty_mode, no_sync)
+            if verbose:
+                log_verbose(f"New vote added:\n{json.dumps(new_block, indent=2)}", verbose)
+            # The scanned QR already encodes this vote; re-encoding it is
+            # wasted work, so only materialize a copy when asked to
+            if args.regen_qr:
+                if ascii_mode:
+                    if ascii_path := create_ascii_qr_code(candidate, verbose):
+                        if verbose:
+                            log_verbose(f"ASCII QR code saved at: {os.path.relpath(ascii_path, BASE_DIR)}", verbose)
+                else:
+                    os.makedirs(QR_DIR, exist_ok=True)
+                    qr_path = os.path.join(QR_DIR, f"qr_code_genesis_{candidate.replace(' ', '_')}_000001.png")
+                    if os.path.abspath(qr_filename) != qr_path:
+                        shutil.copyfile(qr_filename, qr_path)
+                    if verbose:
+                        log_verbose(f"QR code saved at: {os.path.relpath(qr_path, BASE_DIR)}", verbose)
+            if verbose:
+                log_verbose(f"Updated Chain saved at: {url}", verbose)
+            print(f"Chain validation: {message}")
+    elif args.scan_batch:
+        if os.path.isdir(args.scan_batch):
+            qr_dir = args.scan_batch
+            qr_files = sorted(os.path.join(qr_dir, name) for name in os.listdir(qr_dir)
+                              if name.lower().endswith(".png"))
+            if not qr_files:
+                print(f"No .png QR codes found in {qr_dir}")
+                return
+            current_time = datetime.datetime.now(_UTC)
+            if ELECTION_END_TIME and current_time > ELECTION_END_TIME:
+                print(f"Election ended at {ELECTION_END_TIME}. No further votes accepted.")
+                return
+            # Decode everything first, then append all blocks and save once:
+            # one serialize + one write + at most one Gist push for the whole
+            # batch instead of per vote
+            new_blocks = []
+            prev_hash = chain[-1]["hash"] if chain and len(chain) > 1 and "hash" in chain[-1] else GENESIS_HASH
+            for qr_filename, candidate in scan_qr_codes(qr_files, verbose):
+                if candidate is None:
+                    log_verbose(f"Skipping unreadable QR code: {qr_filename}", verbose)
+                    continue
+                new_block = add_vote(candidate, prev_hash)
+                chain.append(new_block)
+                new_blocks.append(new_block)
+                prev_hash = new_block["hash"]
+            if not new_blocks:
+                print("No valid votes found in batch.")
+                return
+            url, message = _record_votes(g, gist, chain, new_blocks, verbose, pretty_mode, no_sync)
+            log_verbose(f"Added {len(new_blocks)} vote(s) from {qr_dir}", verbose)
+            if verbose:
+                log_verbose(f"Updated Chain saved at: {url}", verbose)
+            print(f"Chain validation: {message}")
+        else:
+            print("Please provide a directory of QR codes with --scan-batch, e.g., --scan-batch qrcodes/")
+    elif args.compare:
+        try:
+            official_results = json.loads(args.compare)
+            compare_with_official(official_results)
+        except json.JSONDecodeError:
+            print("Invalid official results format. Use JSON, e.g., '{\"CandidateA\": 100, \"CandidateB\": 150}'")
+    elif args.reset:
+        reset_chain()
+        log_verbose("Local chain reset.", verbose)
+    elif args.prune:
+        vote_to_remove = args.prune
+        chain = prune_chain(chain, vote_to_remove)
+        reset_validation_meta()  # Prune rewrites hashes, so the cursor is stale
+        url = save_chain(g, None if no_sync else gist, chain, verbose, pretty_mode)
+        is_valid, message = validate_chain(chain, verbose)
+        if is_valid:
+            save_validation_meta(chain)
+        if verbose:
+            log_verbose(f"Removed vote for {vote_to_remove}", verbose)
+            log_verbose(f"Updated Chain saved at: {url}", verbose)
+        print(f"Chain validation: {message}")
+    else:
+        if not allowed_candidates:
+            print("No candidates provided. Please run with --candidates flag or provide candidates as positional arguments, e.g., python qrvote.py 'Candidate A' 'Candidate B'")
+            return
+        # Hash-based membership and a prompt string built once, instead of
+        # re-scanning and re-joining the candidate list on every attempt
+        allowed_set = frozenset(allowed_candidates)
+        candidate_list = ', '.join(allowed_candidates)
+        while True:
+            vote = input(f"Select your vote ({candidate_list}) or scan a QR with --scan: ").strip()
+            if vote in allowed_set:
+                break
+            print(f"Invalid choice. Please select one of {candidate_list}.")
+        prev_hash = chain[-1]["hash"] if chain and len(chain) > 1 and "hash" in chain[-1] else GENESIS_HASH
+        new_block = add_vote(vote, prev_hash)
+        chain.append(new_block)
+        url, message = _record_votes(g, gist, chain, [new_block], verbose, pretty_mode, no_sync)
+        if verbose:
+            log_verbose(f"New vote added:\n{json.dumps(new_block, indent=2)}", verbose)
+        if ascii_mode:
+            if ascii_path := create_ascii_qr_code(vote, verbose):
+                if verbose:
+                    log_verbose(f"ASCII QR code saved at: {os.path.relpath(ascii_path, BASE_DIR)}", verbose)
+        else:
+            if qr_path := create_qr_code(vote, steganography_message, verbose):
+                if verbose:
+                    log_verbose(f"QR code saved at: {os.path.relpath(qr_path, BASE_DIR)}", verbose)
+        if verbose:
+            log_verbose(f"Updated Chain saved at: {url}", verbose)
+        print(f"Chain validation: {message}")
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,66 +1,123 @@
-import unittest
-import os
-import sys
-from datetime import datetime, timedelta, timezone
-
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # Add src to path
-import qrvote
-
-class TestQRVote(unittest.TestCase):
-    def setUp(self):
-        self.test_dir = "test_temp"
-        os.makedirs(self.test_dir, exist_ok=True)
-        os.chdir(self.test_dir)
-        self.chain_file = "vote_chain.json"
-        self.qr_dir = "qrcodes"
-
-    def tearDown(self):
-        os.chdir("..")
-        for file in os.listdir(self.test_dir):
-            os.remove(os.path.join(self.test_dir, file))
-        os.rmdir(self.test_dir)
-
-    def test_add_vote(self):
-        block = qrvote.add_vote("A", "genesis_hash")
-        self.assertIn("vote", block)
-        self.assertIn("timestamp", block)
-        self.assertIn("prev_hash", block)
-        self.assertIn("hash", block)
-        self.assertEqual(block["prev_hash"], "genesis_hash")
-
-    def test_validate_chain(self):
-        chain = [{"election_end_time": "2025-06-25T16:52:00+00:00"},
-                 {"vote": "A", "timestamp": "2025-06-25T13:52:00", "prev_hash": "genesis_hash", "hash": qrvote.hash_block({"vote": "A", "timestamp": "2025-06-25T13:52:00", "prev_hash": "genesis_hash"})},
-                 {"vote": "B", "timestamp": "2025-06-25T13:53:00", "prev_hash": qrvote.hash_block({"vote": "A", "timestamp": "2025-06-25T13:52:00", "prev_hash": "genesis_hash"}), "hash": qrvote.hash_block({"vote": "B", "timestamp": "2025-06-25T13:53:00", "prev_hash": qrvote.hash_block({"vote": "A", "timestamp": "2025-06-25T13:52:00", "prev_hash": "genesis_hash"})})}
-                ]
-        is_valid, message = qrvote.validate_chain(chain)
-        self.assertTrue(is_valid)
-        self.assertEqual(message, "Chain is valid")
-        invalid_chain = chain[:-1] + [{"vote": "C", "timestamp": "2025-06-25T13:54:00", "prev_hash": "wrong_hash", "hash": "fake_hash"}]
-        is_valid, message = qrvote.validate_chain(invalid_chain)
-        self.assertFalse(is_valid)
-
-    def test_create_qr_code(self):
-        qr_path = qrvote.create_qr_code("A", verbose=True)
-        self.assertTrue(os.path.exists(qr_path))
-        qr_path_stego = qrvote.create_qr_code("B", steganography_message="secret", verbose=True)
-        self.assertTrue(os.path.exists(qr_path_stego))
-
-    def test_scan_and_vote(self):
-        qr_path = qrvote.create_qr_code("A", verbose=True)
-        vote = qrvote.scan_and_vote(qr_path, verbose=True)
-        self.assertEqual(vote, "A")
-        qrvote.ELECTION_END_TIME = datetime.utcnow().replace(tzinfo=timezone.utc) - timedelta(minutes=1)
-        vote = qrvote.scan_and_vote(qr_path, verbose=True)
-        self.assertIsNone(vote)
-
-    def test_save_chain(self):
-    chain = [{"election_end_time": "2025-06-25T17:04:00+00:00"}, {"vote": "A", "timestamp": "2025-06-25T14:04:00", "prev_hash": "genesis_hash", "hash": qrvote.hash_block({"vote": "A", "timestamp": "2025-06-25T14:04:00", "prev_hash": "genesis_hash"})}]
-    url = qrvote.save_chain(None, None, chain, verbose=True)  # Offline mode
-    self.assertTrue(os.path.exists(qrvote.os.path.join(self.test_dir, "vote_chain.json")))
-    with open(qrvote.os.path.join(self.test_dir, "vote_chain.json"), "r") as f:
-        saved_chain = json.load(f)
-    self.assertEqual(chain, saved_chain)
-
-if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+import json
+import unittest
+import os
+import shutil
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # Add src to path
+import qrvote
+
+class TestQRVote(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.abspath("test_temp")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.orig_base_dir = qrvote.BASE_DIR
+        qrvote.BASE_DIR = self.test_dir  # Keep test artifacts out of src/
+        qrvote._derive_paths()
+        self.chain_file = os.path.join(self.test_dir, "vote_chain.json")
+        self.qr_dir = os.path.join(self.test_dir, "qrcodes")
+
+    def tearDown(self):
+        qrvote.BASE_DIR = self.orig_base_dir
+        qrvote._derive_paths()
+        qrvote.ELECTION_END_TIME = None
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_add_vote(self):
+        block = qrvote.add_vote("A", "genesis_hash")
+        self.assertIn("vote", block)
+        self.assertIn("timestamp", block)
+        self.assertIn("prev_hash", block)
+        self.assertIn("hash", block)
+        self.assertEqual(block["prev_hash"], "genesis_hash")
+
+    def test_validate_chain(self):
+        chain = [{"election_end_time": "2025-06-25T16:52:00+00:00"},
+                 {"vote": "A", "timestamp": "2025-06-25T13:52:00", "prev_hash": "genesis_hash", "hash": qrvote.hash_block({"vote": "A", "timestamp": "2025-06-25T13:52:00", "prev_hash": "genesis_hash"})},
+                 {"vote": "B", "timestamp": "2025-06-25T13:53:00", "prev_hash": qrvote.hash_block({"vote": "A", "timestamp": "2025-06-25T13:52:00", "prev_hash": "genesis_hash"}), "hash": qrvote.hash_block({"vote": "B", "timestamp": "2025-06-25T13:53:00", "prev_hash": qrvote.hash_block({"vote": "A", "timestamp": "2025-06-25T13:52:00", "prev_hash": "genesis_hash"})})}
+                ]
+        is_valid, message = qrvote.validate_chain(chain)
+        self.assertTrue(is_valid)
+        self.assertEqual(message, "Chain is valid")
+        invalid_chain = chain[:-1] + [{"vote": "C", "timestamp": "2025-06-25T13:54:00", "prev_hash": "wrong_hash", "hash": "fake_hash"}]
+        is_valid, message = qrvote.validate_chain(invalid_chain)
+        self.assertFalse(is_valid)
+
+    def test_create_qr_code(self):
+        qr_path = qrvote.create_qr_code("A", verbose=True)
+        self.assertTrue(os.path.exists(qr_path))
+        qr_path_stego = qrvote.create_qr_code("B", steganography_message="secret", verbose=True)
+        self.assertTrue(os.path.exists(qr_path_stego))
+
+    @unittest.skipUnless(qrvote.HAS_NUMPY, "numpy not installed")
+    def test_lsb_round_trip(self):
+        qr_path = qrvote.create_qr_code("A", verbose=True)
+        from PIL import Image
+        with Image.open(qr_path) as image:
+            stego_image = qrvote._lsb_hide(image, "secret")
+        self.assertEqual(qrvote._lsb_reveal(stego_image), "secret")
+
+    def test_scan_and_vote(self):
+        qr_path = qrvote.create_qr_code("A", verbose=True)
+        vote = qrvote.scan_and_vote(qr_path, verbose=True)
+        self.assertEqual(vote, "A")
+        qrvote.ELECTION_END_TIME = datetime.utcnow().replace(tzinfo=timezone.utc) - timedelta(minutes=1)
+        vote = qrvote.scan_and_vote(qr_path, verbose=True)
+        self.assertIsNone(vote)
+
+    def test_canonical_bytes_matches_generic_serialization(self):
+        for vote in ("A", "Candidate \"B\"", "Votação"):
+            block = {"vote": vote, "timestamp": "2025-06-25T13:52:00", "prev_hash": "genesis_hash"}
+            expected = qrvote._dumps_canonical(block)
+            built = qrvote._canonical_bytes(block["prev_hash"], block["timestamp"], block["vote"])
+            self.assertEqual(built, expected)
+
+    def test_chain_columns_round_trip(self):
+        block_a = qrvote.add_vote("A", "genesis_hash")
+        block_b = qrvote.add_vote("B", block_a["hash"])
+        chain = [{"election_end_time": "2025-06-25T16:52:00+00:00"}, block_a, block_b]
+        columns = qrvote.ChainColumns.from_blocks(chain)
+        self.assertEqual(columns.votes, ["A", "B"])
+        self.assertEqual(columns.prev_hashes[1:], columns.hashes[:-1])
+        self.assertEqual(columns.to_blocks(), [block_a, block_b])
+
+    def test_incremental_validation(self):
+        block_a = qrvote.add_vote("A", "genesis_hash")
+        block_b = qrvote.add_vote("B", block_a["hash"])
+        chain = [{"election_end_time": "2025-06-25T16:52:00+00:00"}, block_a, block_b]
+        self.assertEqual(qrvote.load_validation_start(chain), 0)  # No cursor yet
+        qrvote.save_validation_meta(chain)
+        self.assertEqual(qrvote.load_validation_start(chain), 2)
+        is_valid, message = qrvote.validate_chain(chain, start=2)
+        self.assertTrue(is_valid)
+        chain.append(qrvote.add_vote("A", block_b["hash"]))
+        self.assertEqual(qrvote.load_validation_start(chain), 2)  # Cursor still valid for the prefix
+        is_valid, message = qrvote.validate_chain(chain, start=2)
+        self.assertTrue(is_valid)
+        qrvote.reset_validation_meta()
+        self.assertEqual(qrvote.load_validation_start(chain), 0)
+
+    def test_append_log_round_trip(self):
+        block_a = qrvote.add_vote("A", "genesis_hash")
+        chain = [{"election_end_time": "2025-06-25T16:52:00+00:00"}, block_a]
+        qrvote.save_chain(None, None, chain, verbose=True)
+        block_b = qrvote.add_vote("B", block_a["hash"])
+        qrvote.append_votes([block_b], verbose=True)
+        _, loaded = qrvote.load_chain(None)
+        self.assertEqual(loaded, chain + [block_b])
+        qrvote.save_chain(None, None, loaded, verbose=True)  # Compacts the log
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "vote_chain.log")))
+        _, compacted = qrvote.load_chain(None)
+        self.assertEqual(compacted, loaded)
+
+    def test_save_chain(self):
+        chain = [{"election_end_time": "2025-06-25T17:04:00+00:00"}, {"vote": "A", "timestamp": "2025-06-25T14:04:00", "prev_hash": "genesis_hash", "hash": qrvote.hash_block({"vote": "A", "timestamp": "2025-06-25T14:04:00", "prev_hash": "genesis_hash"})}]
+        url = qrvote.save_chain(None, None, chain, verbose=True)  # Offline mode
+        self.assertTrue(os.path.exists(self.chain_file))
+        with open(self.chain_file, "r") as f:
+            saved_chain = json.load(f)
+        self.assertEqual(chain, saved_chain)
+
+if __name__ == '__main__':
+    unittest.main()